@@ -1,14 +1,36 @@
 import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
 from http import HTTPStatus
-from typing import Callable, Dict, Optional, Type
+from typing import (
+    Any, Awaitable, Callable, Dict, List, NamedTuple, Optional, Set, Tuple,
+    Type, Union,
+)
 from urllib.parse import urlparse
 
-from aiohttp import web
+from aiohttp import ClientSession, web
 from aiohttp.web import BaseRequest, Response
 
 from .client import BotAPIClient
-from .types import Message, Update, UpdateID
-from .utils import LoggerDescriptor, TemplateFormatter, extract_users
+from .directory import UserDirectory, full_name, normalize_query
+from .lanes import LaneQueue, LaneStats
+from .membership import ChatMembership
+from .profiling import DispatchProfiler
+from .types import (
+    ChatMemberUpdated, InlineQuery, InlineQueryResult, Message, Update,
+    UpdateID, User, UserID,
+)
+from .utils import (
+    LoggerDescriptor, LoopLagMonitor, TemplateFormatter, TTLCache,
+    cancel_other_tasks, extract_users,
+)
+
+
+# decoded update or raw body, and the size of the body in bytes
+QueuedUpdate = Tuple[Union[Update, bytes], int]
+# gets the request body, returns False if the update was rejected (e.g.,
+# the bot is stopping), raises ValueError if the body is not an update
+UpdateCallback = Callable[[bytes], bool]
 
 
 class WebhookURLFormatter(TemplateFormatter):
@@ -24,9 +46,10 @@ class UpdateProcessor:
 
     log = LoggerDescriptor()
 
-    def __init__(self, update: Update):
+    def __init__(self, update: Update, dispatcher: 'UpdateDispatcher'):
         self.update_id: UpdateID = update['update_id']
         self.update_body = update[self.update_type]
+        self.dispatcher = dispatcher
 
     def __init_subclass__(cls, update_type: str) -> None:
         if update_type in cls.update_types:
@@ -36,7 +59,9 @@ class UpdateProcessor:
         cls.update_types[update_type] = cls
 
     @classmethod
-    def dispatch(cls, update: Update) -> 'UpdateProcessor':
+    def dispatch(
+        cls, update: Update, dispatcher: 'UpdateDispatcher',
+    ) -> 'UpdateProcessor':
         cls.log.info('dispatching update: %s', update)
         keys = list(update.keys())
         if 'update_id' not in keys:
@@ -48,9 +73,14 @@ class UpdateProcessor:
         if update_type not in cls.update_types:
             raise KeyError(f'unsupported update type: {update_type}')
         processor = cls.update_types[update_type]
-        return processor(update)
+        return processor(update, dispatcher)
 
-    def __call__(self) -> None:
+    def __call__(self) -> Optional[Awaitable[Any]]:
+        """Process the update.
+
+        May return an awaitable (e.g., an API call), which the dispatcher
+        runs as a task on the event loop.
+        """
         raise NotImplementedError
 
 
@@ -58,71 +88,297 @@ class MessageProcessor(UpdateProcessor, update_type='message'):
 
     def __call__(self) -> None:
         message: Message = self.update_body
-        for user in extract_users(message):
-            self.log.info(user)
+        profiler = self.dispatcher.profiler
+        with profiler.timer('extract_users'):
+            users = extract_users(message)
+        with profiler.timer('log'):
+            for user in users:
+                self.log.info(user)
+        with profiler.timer('users'):
+            self.dispatcher.users.update(users)
+        with profiler.timer('membership'):
+            self.dispatcher.membership.track_message(message)
+
+
+class ChatMemberProcessor(UpdateProcessor, update_type='chat_member'):
+
+    def __call__(self) -> None:
+        chat_member: ChatMemberUpdated = self.update_body
+        self.dispatcher.membership.track_chat_member(chat_member)
+
+
+class InlineQueryProcessor(UpdateProcessor, update_type='inline_query'):
+
+    results_limit = 20
+    # seconds Telegram may cache the answer for the user who asked
+    cache_time = 300
+
+    def __call__(self) -> Awaitable[Any]:
+        inline_query: InlineQuery = self.update_body
+        asker_id = UserID(inline_query['from']['id'])
+        query = normalize_query(inline_query['query'])
+        cache = self.dispatcher.inline_cache
+        cache_key = (asker_id, query)
+        results = cache.get(cache_key)
+        if results is None:
+            # only the asker and users the asker can see in a shared group,
+            # so the bot doesn't disclose users from other chats
+            visible = self.dispatcher.membership.contacts(asker_id)
+            visible.add(asker_id)
+            users = self.dispatcher.users.search(
+                query, self.results_limit, visible)
+            results = [self.make_result(user) for user in users]
+            cache.set(cache_key, results)
+        return self.dispatcher.client.answer_inline_query(
+            inline_query['id'], results,
+            cache_time=self.cache_time, is_personal=True,
+        )
+
+    def make_result(self, user: User) -> InlineQueryResult:
+        name = full_name(user)
+        details = f'id {user["id"]}'
+        if user['username']:
+            details = f'@{user["username"]}, {details}'
+        return {
+            'type': 'article',
+            'id': str(user['id']),
+            'title': name,
+            'description': details,
+            'input_message_content': {'message_text': f'{name} ({details})'},
+        }
 
 
 class UpdateDispatcher:
 
     processor_class = UpdateProcessor
 
+    # updates with bodies larger than this (in bytes) are processed
+    # in the executor to keep the event loop responsive; it must be
+    # a thread pool, processors update the dispatcher state in place
+    offload_threshold = 64 * 1024
+    min_offload_threshold = 4 * 1024
+    # the threshold is lowered while the event loop lag exceeds this
+    # (in seconds) and raised back, up to the class-level
+    # offload_threshold, while it stays well below; the lag is sampled
+    # every lag_check_interval seconds by the owner of the event loop,
+    # see WhoDatBot.on_lag
+    lag_target = 0.05
+    lag_check_interval = 1.0
+
+    # update type -> lane, other update types go to the default lane;
+    # interactive updates are the ones a user is waiting on
+    # and Telegram times out
+    update_lanes = {
+        'callback_query': 'interactive',
+        'inline_query': 'interactive',
+        'chosen_inline_result': 'interactive',
+        'shipping_query': 'interactive',
+        'pre_checkout_query': 'interactive',
+    }
+    lane_weights = {'interactive': 8, 'default': 1}
+    default_lane = 'default'
+
+    # answers to inline queries, keyed by asker and normalized query
+    inline_cache_size = 1024
+    inline_cache_ttl = 60.0
+
     log = LoggerDescriptor()
 
-    def __init__(self) -> None:
-        self.queue: asyncio.Queue[Optional[Update]] = asyncio.Queue()
+    def __init__(
+        self, *, client: BotAPIClient, profiler: DispatchProfiler,
+        executor: Optional[ThreadPoolExecutor] = None,
+    ) -> None:
+        self.queue: LaneQueue[QueuedUpdate] = LaneQueue(
+            self.lane_weights, self.default_lane)
+        # None means the default executor of the loop
+        self._executor = executor
+        self.client = client
+        self.membership = ChatMembership()
+        self.users = UserDirectory()
+        self.inline_cache: TTLCache[
+            Tuple[UserID, str], List[InlineQueryResult]
+        ] = TTLCache(maxsize=self.inline_cache_size, ttl=self.inline_cache_ttl)
+        self.profiler = profiler
         self._running = False
+        self._stopped = asyncio.Event()
+        self._tasks: Set['asyncio.Future[Any]'] = set()
+
+    def put_body(self, body: bytes) -> bool:
+        """Decode and queue the update, see UpdateCallback.
+
+        Bodies above offload_threshold are queued raw (in the default lane)
+        and decoded in the executor.
+        """
+        if self.queue.closed:
+            return False
+        size = len(body)
+        if size > self.offload_threshold:
+            self.queue.put_nowait((body, size))
+            return True
+        return self.put_nowait(self._decode(body), size)
+
+    def _decode(self, body: bytes) -> Update:
+        with self.profiler.timer('decode'):
+            update = json.loads(body)
+        if not isinstance(update, dict):
+            raise ValueError('update is not an object')
+        return update
+
+    def put_nowait(self, update: Update, size: int = 0) -> bool:
+        """Queue the update, return False if the dispatcher is draining."""
+        if self.queue.closed:
+            return False
+        lane = None
+        for key in update:
+            if key != 'update_id':
+                lane = self.update_lanes.get(key)
+                break
+        self.queue.put_nowait((update, size), lane)
+        return True
+
+    def lane_stats(self) -> Dict[str, LaneStats]:
+        return self.queue.stats()
 
     async def run(self) -> None:
         if self._running:
             return
         self.log.info('starting dispatcher')
         self._running = True
+        self._stopped.clear()
         try:
             await self._run()
         finally:
             self.log.info('stopping dispatcher')
+            for lane, stats in self.lane_stats().items():
+                self.log.info('%s lane: %s', lane, stats)
             self._running = False
+            self._stopped.set()
+
+    async def drain(self, timeout: float) -> int:
+        """Process queued updates and stop.
+
+        Returns the number of updates left in the queue after the timeout.
+        """
+        self.queue.close()
+        if self._running:
+            try:
+                await asyncio.wait_for(self._stopped.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return self.queue.qsize()
+
+    def tune(self, lag: float) -> None:
+        threshold = self.offload_threshold
+        if lag > self.lag_target:
+            threshold = max(self.min_offload_threshold, threshold // 2)
+        elif lag < self.lag_target / 2:
+            threshold = min(
+                type(self).offload_threshold, threshold + threshold // 4)
+        if threshold != self.offload_threshold:
+            self.log.debug(
+                'loop lag %.3fs, offload threshold: %d -> %d',
+                lag, self.offload_threshold, threshold,
+            )
+            self.offload_threshold = threshold
 
     async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
         while True:
-            update = await self.queue.get()
-            if update is None:
+            item = await self.queue.get()
+            if item is None:
                 break
+            update, size = item
             try:
-                processor = self.processor_class.dispatch(update)
-                processor()
+                if size > self.offload_threshold:
+                    result = await loop.run_in_executor(
+                        self._executor, self._process, update)
+                else:
+                    result = self._process(update)
+                if result is not None:
+                    # don't hold the queue during API round trips
+                    task = asyncio.ensure_future(result)
+                    self._tasks.add(task)
+                    task.add_done_callback(self._on_task_done)
             except Exception:
                 self.log.exception('')
 
+    def _on_task_done(self, task: 'asyncio.Future[Any]') -> None:
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            self.log.error('', exc_info=task.exception())
+
+    def _process(
+        self, update: Union[Update, bytes],
+    ) -> Optional[Awaitable[Any]]:
+        return self.profiler.call(lambda: self._process_unprofiled(update))
+
+    def _process_unprofiled(
+        self, update: Union[Update, bytes],
+    ) -> Optional[Awaitable[Any]]:
+        if isinstance(update, bytes):
+            update = self._decode(update)
+        profiler = self.profiler
+        with profiler.timer('dispatch'):
+            processor = self.processor_class.dispatch(update, self)
+        with profiler.timer(f'process.{processor.update_type}'):
+            return processor()
+
 
 class WebhookServer:
 
     log = LoggerDescriptor()
 
     def __init__(
-        self, *, port: int, secret_path: str,
-        on_update: Callable[[Update], None],
+        self, *, port: int,
+        secret_path: Optional[str] = None,
+        on_update: Optional[UpdateCallback] = None,
         on_close: Optional[Callable[[], None]] = None,
         loop: Optional[asyncio.AbstractEventLoop] = None,
     ) -> None:
         self._port = port
-        self._secret_path = secret_path
-        self._on_update = on_update
+        self._routes: Dict[str, UpdateCallback] = {}
+        if secret_path is not None:
+            if on_update is None:
+                raise ValueError('secret_path requires on_update')
+            self.add_route(secret_path, on_update)
         self._on_close = on_close
         if loop is None:
             loop = asyncio.get_event_loop()
         self._loop = loop
+        self._draining = False
+        self._stopped = asyncio.Event()
+
+    def add_route(self, secret_path: str, on_update: UpdateCallback) -> None:
+        if secret_path in self._routes:
+            raise ValueError(f'already routed: {secret_path}')
+        self._routes[secret_path] = on_update
+
+    def remove_route(self, secret_path: str) -> None:
+        del self._routes[secret_path]
 
     async def handler(self, request: BaseRequest) -> Response:
         # Obscure (hah) any error with 403 FORBIDDEN
         error_status = HTTPStatus.FORBIDDEN
-        if request.method != 'POST' or request.path != self._secret_path:
+        if request.method != 'POST':
             return Response(status=error_status)
+        on_update = self._routes.get(request.path)
+        if on_update is None:
+            return Response(status=error_status)
+        # Telegram redelivers the update later, possibly to a new process
+        retry_later = Response(status=HTTPStatus.SERVICE_UNAVAILABLE)
+        if self._draining:
+            return retry_later
+        body = await request.read()
+        # drain() may have been called while the body was being read
+        if self._draining:
+            return retry_later
+        # the body is decoded by the bot, large ones off the event loop
         try:
-            update: Update = await request.json()
+            accepted = on_update(body)
         except ValueError:
             return Response(status=error_status)
-        self._on_update(update)
+        if not accepted:
+            return retry_later
         return Response(status=HTTPStatus.NO_CONTENT)
 
     async def run(self) -> None:
@@ -132,25 +388,48 @@ class WebhookServer:
         site = web.TCPSite(runner, 'localhost', self._port)
         try:
             await site.start()
-            while True:
-                await asyncio.sleep(3600)
-            await self._dispatcher.queue.put(None)
+            await self._stopped.wait()
         finally:
             await runner.cleanup()
 
+    def drain(self) -> None:
+        self.log.info('draining webhook server')
+        self._draining = True
+
+    def stop(self) -> None:
+        self._stopped.set()
+
+
+class ShutdownReport(NamedTuple):
+
+    pending_updates: int
+    pending_calls: int
+
 
 class WhoDatBot:
 
     dispatcher_class = UpdateDispatcher
+    client_class = BotAPIClient
+
+    # lane stats are logged at most this often (in seconds) while running
+    lane_stats_interval = 60.0
 
     log = LoggerDescriptor()
 
+    _username: Optional[str] = None
+    _stop_task: Optional['asyncio.Future[ShutdownReport]'] = None
+    _lag_monitor_task: Optional['asyncio.Task[None]'] = None
+
     def __init__(
         self, *,
         token: str,
         webhook_url_template: str,
         webhook_secret: str,
         webhook_port: int,
+        session: Optional[ClientSession] = None,
+        server: Optional[WebhookServer] = None,
+        profiler: Optional[DispatchProfiler] = None,
+        shutdown_timeout: float = 10.0,
         loop: Optional[asyncio.AbstractEventLoop] = None,
     ) -> None:
         webhook_url_formatter = WebhookURLFormatter(webhook_url_template)
@@ -159,30 +438,97 @@ class WhoDatBot:
         if loop is None:
             loop = asyncio.get_event_loop()
         self._loop = loop
-        self._dispatcher = self.dispatcher_class()
-        self._client = BotAPIClient(token=token, loop=loop)
-        self._server = WebhookServer(
-            port=webhook_port, secret_path=urlparse(webhook_url).path,
-            on_update=self.on_update,
-        )
-
-    async def run(self) -> None:
+        if profiler is None:
+            profiler = DispatchProfiler(loop=loop)
+        self.profiler = profiler
+        self._client = self.client_class(
+            token=token, session=session, loop=loop)
+        self._dispatcher = self.dispatcher_class(
+            client=self._client, profiler=profiler)
+        self.secret_path = secret_path = urlparse(webhook_url).path
+        # a shared server is run by its owner (see host.WhoDatBotHost)
+        self._owns_server = server is None
+        if server is None:
+            server = WebhookServer(port=webhook_port, loop=loop)
+        server.add_route(secret_path, self.on_update)
+        self._server = server
+        self._shutdown_timeout = shutdown_timeout
+        self._lane_stats_logged = loop.time()
+
+    async def start(self) -> None:
         self._username = await self._client.get_username()
-        await self._client.set_webhook(self._webhook_url)
+        # some update types (e.g., chat_member) are only sent on request
+        update_types = self._dispatcher.processor_class.update_types
+        await self._client.set_webhook(
+            self._webhook_url, allowed_updates=list(update_types))
         self._dispatcher_task = asyncio.create_task(self._dispatcher.run())
-        await self._server.run()
+        # one monitor per event loop, a shared loop is monitored by its
+        # owner (see host.WhoDatBotHost)
+        if self._owns_server:
+            lag_monitor = LoopLagMonitor(
+                interval=self.dispatcher_class.lag_check_interval,
+                on_lag=self.on_lag,
+            )
+            self._lag_monitor_task = asyncio.create_task(lag_monitor.run())
 
-    async def close(self) -> None:
-        await self._dispatcher.queue.put(None)
+    async def run(self) -> None:
+        await self.start()
+        if self._owns_server:
+            await self._server.run()
+
+    async def stop(self) -> ShutdownReport:
+        """Drain and stop the bot within shutdown_timeout.
+
+        New updates are refused with a retryable error, queued updates and
+        in-flight API calls are given until the deadline to complete.
+        Safe to call more than once, e.g., from a signal handler and then
+        from close().
+        """
+        if self._stop_task is None:
+            self._stop_task = asyncio.ensure_future(self._stop())
+        return await asyncio.shield(self._stop_task)
+
+    async def _stop(self) -> ShutdownReport:
+        loop = self._loop
+        deadline = loop.time() + self._shutdown_timeout
+        # a shared server is drained by its owner
+        if self._owns_server:
+            self._server.drain()
+        if self._lag_monitor_task is not None:
+            self._lag_monitor_task.cancel()
+        pending_updates = await self._dispatcher.drain(
+            timeout=deadline - loop.time())
+        pending_calls = await self._client.flush(
+            timeout=deadline - loop.time())
         await self._client.close()
-        await self._task_cleanup()
+        report = ShutdownReport(pending_updates, pending_calls)
+        if pending_updates or pending_calls:
+            self.log.warning(
+                '@%s: shutdown deadline exceeded, left behind '
+                '%d update(s) and %d API call(s)',
+                self._username, pending_updates, pending_calls,
+            )
+        else:
+            self.log.info('@%s: shutdown complete', self._username)
+        if self._owns_server:
+            self._server.stop()
+        return report
 
-    def on_update(self, update: Update) -> None:
-        self._dispatcher.queue.put_nowait(update)
-
-    async def _task_cleanup(self) -> None:
-        current_task = asyncio.current_task()
-        tasks = [t for t in asyncio.all_tasks() if t is not current_task]
-        for task in tasks:
-            task.cancel()
-        await asyncio.gather(*tasks, return_exceptions=True)
+    async def close(self) -> None:
+        await self.stop()
+        await cancel_other_tasks()
+
+    def on_update(self, body: bytes) -> bool:
+        return self._dispatcher.put_body(body)
+
+    def on_lag(self, lag: float) -> None:
+        """Handle a loop lag sample, see LoopLagMonitor.
+
+        Also logs the lane stats every lane_stats_interval seconds.
+        """
+        self._dispatcher.tune(lag)
+        now = self._loop.time()
+        if now - self._lane_stats_logged >= self.lane_stats_interval:
+            self._lane_stats_logged = now
+            for lane, stats in self._dispatcher.lane_stats().items():
+                self.log.info('@%s %s lane: %s', self._username, lane, stats)
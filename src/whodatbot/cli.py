@@ -2,9 +2,12 @@ import argparse
 import asyncio
 import logging
 import os
-from typing import Any, Callable
+import signal
+from typing import Any, Callable, Optional, Union, cast
 
 from .bot import WhoDatBot
+from .host import WhoDatBotHost, load_config
+from .profiling import DispatchProfiler
 
 
 def _noop_setter(instance: Any, value: Any) -> None:
@@ -42,18 +45,37 @@ class StoreEnvVarAction(argparse._StoreAction):
 
 class Args:
 
-    token: str
-    webhook_url_template: str
-    webhook_secret: str
-    webhook_port: int
+    config: Optional[str]
+    token: Optional[str]
+    webhook_url_template: Optional[str]
+    webhook_secret: Optional[str]
+    webhook_port: Optional[int]
+    profile_sample_rate: float
+    profile_output: str
+    shutdown_timeout: float
+
+
+# required unless the bots are configured with --config
+SINGLE_BOT_OPTIONS = (
+    'token', 'webhook_url_template', 'webhook_secret', 'webhook_port',
+)
 
 
 def parse_args() -> Args:
     parser = argparse.ArgumentParser(prog=__package__)
     parser.register('action', 'store_envvar', StoreEnvVarAction)
+    parser.add_argument(
+        '--config',
+        action='store_envvar',
+        envvar='WHODATBOT_CONFIG',
+        metavar='PATH',
+        help=(
+            'multi-bot INI config; when given, all bots are served by '
+            'one process and the single-bot options are ignored'
+        ),
+    )
     parser.add_argument(
         '--token',
-        required=True,
         action='store_envvar',
         envvar='WHODATBOT_API_TOKEN',
         metavar='TOKEN',
@@ -61,7 +83,6 @@ def parse_args() -> Args:
     )
     parser.add_argument(
         '--webhook-url-template',
-        required=True,
         action='store_envvar',
         envvar='WHODATBOT_WEBHOOK_URL_TEMPLATE',
         metavar='URL_TEMPLATE',
@@ -72,7 +93,6 @@ def parse_args() -> Args:
     )
     parser.add_argument(
         '--webhook-secret',
-        required=True,
         action='store_envvar',
         envvar='WHODATBOT_WEBHOOK_SECRET',
         metavar='SECRET',
@@ -80,24 +100,83 @@ def parse_args() -> Args:
     )
     parser.add_argument(
         '--webhook-port',
-        required=True,
         action='store_envvar',
         type=int,
         envvar='WHODATBOT_WEBHOOK_PORT',
         metavar='PORT',
         help='webhook HTTP port',
     )
-    return parser.parse_args(namespace=Args())
+    parser.add_argument(
+        '--profile-sample-rate',
+        action='store_envvar',
+        type=float,
+        default=0.01,
+        envvar='WHODATBOT_PROFILE_SAMPLE_RATE',
+        metavar='RATE',
+        help=(
+            'fraction of updates run under cProfile while profiling is on '
+            '(toggled with SIGUSR1, stats are dumped with SIGUSR2)'
+        ),
+    )
+    parser.add_argument(
+        '--profile-output',
+        action='store_envvar',
+        default='whodatbot.prof.txt',
+        envvar='WHODATBOT_PROFILE_OUTPUT',
+        metavar='PATH',
+        help='profiler stats file',
+    )
+    parser.add_argument(
+        '--shutdown-timeout',
+        action='store_envvar',
+        type=float,
+        default=10.0,
+        envvar='WHODATBOT_SHUTDOWN_TIMEOUT',
+        metavar='SECONDS',
+        help=(
+            'time given to queued updates and in-flight API calls '
+            'on SIGINT/SIGTERM'
+        ),
+    )
+    args = parser.parse_args(namespace=Args())
+    if args.config is None:
+        missing = [
+            '--' + option.replace('_', '-') for option in SINGLE_BOT_OPTIONS
+            if getattr(args, option) is None
+        ]
+        if missing:
+            parser.error(
+                'the following arguments are required: ' + ', '.join(missing))
+    return args
 
 
 async def main_coro() -> None:
     args = parse_args()
-    bot = WhoDatBot(
-        token=args.token,
-        webhook_url_template=args.webhook_url_template,
-        webhook_secret=args.webhook_secret,
-        webhook_port=args.webhook_port,
+    profiler = DispatchProfiler(
+        sample_rate=args.profile_sample_rate,
+        output_path=args.profile_output,
     )
+    profiler.install_signal_handlers()
+    bot: Union[WhoDatBot, WhoDatBotHost]
+    if args.config is not None:
+        bot = WhoDatBotHost(
+            load_config(args.config),
+            profiler=profiler,
+            shutdown_timeout=args.shutdown_timeout,
+        )
+    else:
+        bot = WhoDatBot(
+            token=cast(str, args.token),
+            webhook_url_template=cast(str, args.webhook_url_template),
+            webhook_secret=cast(str, args.webhook_secret),
+            webhook_port=cast(int, args.webhook_port),
+            profiler=profiler,
+            shutdown_timeout=args.shutdown_timeout,
+        )
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(
+            signum, lambda: asyncio.ensure_future(bot.stop()))
     try:
         await bot.run()
     finally:
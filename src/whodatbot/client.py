@@ -1,13 +1,24 @@
 import asyncio
-from typing import Any, Awaitable, Optional, cast
+import json
+from types import MappingProxyType
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Union, cast
 
 import aiohttp
 
+from .types import InlineQueryResult
 from .utils import LoggerDescriptor, TemplateFormatter
 
 
 DEFAULT_URL_TEMPLATE = 'https://api.telegram.org/bot{token}/{method}'
 
+# shared by all requests, aiohttp copies it into the request headers
+JSON_HEADERS = MappingProxyType({'Content-Type': 'application/json'})
+
+
+# e.g., orjson.dumps and orjson.loads
+JSONEncoder = Callable[[Any], Union[str, bytes]]
+JSONDecoder = Callable[[bytes], Any]
+
 
 class URLTemplateFormatter(TemplateFormatter):
 
@@ -36,6 +47,9 @@ class BotAPIClient:
 
     def __init__(
         self, *, token: str, url_template: Optional[str] = None,
+        session: Optional[aiohttp.ClientSession] = None,
+        json_dumps: JSONEncoder = json.dumps,
+        json_loads: JSONDecoder = json.loads,
         loop: Optional[asyncio.AbstractEventLoop] = None,
     ) -> None:
         if loop is None:
@@ -45,32 +59,94 @@ class BotAPIClient:
             url_template = DEFAULT_URL_TEMPLATE
         url_formatter = URLTemplateFormatter(url_template)
         self._url_template = url_formatter(token=token)
-        self._session = aiohttp.ClientSession(loop=loop)
+        # method -> URL, filled on the first call of each method
+        self._urls: Dict[str, str] = {}
+        self._json_dumps = json_dumps
+        self._json_loads = json_loads
+        # a shared session is owned (and closed) by whoever passed it in
+        self._owns_session = session is None
+        if session is None:
+            session = aiohttp.ClientSession(loop=loop)
+        self._session = session
+        self._pending_calls = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    async def flush(self, timeout: float) -> int:
+        """Wait for in-flight API calls.
+
+        Returns the number of calls still pending after the timeout.
+        """
+        if self._pending_calls:
+            try:
+                await asyncio.wait_for(self._idle.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return self._pending_calls
 
     async def close(self) -> None:
-        await self._session.close()
+        if self._owns_session:
+            await self._session.close()
+
+    def _get_url(self, method: str) -> str:
+        url = self._urls.get(method)
+        if url is None:
+            url = self._urls[method] = self._url_template.format(method=method)
+        return url
 
     async def _call_api(self, method: str, **params: Any) -> Any:
-        url = self._url_template.format(method=method)
-        self.log.debug(f'Telegram API call: method={method} params={params}')
-        async with self._session.post(url, json=params) as response:
-            response_json = await response.json()
-        self.log.debug(f'Telegram API response: {response_json}')
+        """Call the method and return the 'result' field of the response."""
+        url = self._get_url(method)
+        self.log.debug(
+            'Telegram API call: method=%s params=%s', method, params)
+        data = self._json_dumps(params)
+        self._pending_calls += 1
+        self._idle.clear()
+        try:
+            async with self._session.post(
+                url, data=data, headers=JSON_HEADERS,
+            ) as response:
+                body = await response.read()
+        finally:
+            self._pending_calls -= 1
+            if not self._pending_calls:
+                self._idle.set()
+        response_json = self._json_loads(body)
+        self.log.debug('Telegram API response: %s', response_json)
         if not response_json['ok']:
             raise BotAPIClientError(
                 error_code=response_json['error_code'],
                 description=response_json['description'],
             )
-        return response_json
-
-    def set_webhook(self, url: str) -> Awaitable[Any]:
-        return self._call_api('setWebhook', url=url)
+        return response_json['result']
+
+    def set_webhook(
+        self, url: str, allowed_updates: Optional[List[str]] = None,
+    ) -> Awaitable[Any]:
+        params: Dict[str, Any] = {}
+        if allowed_updates is not None:
+            params['allowed_updates'] = allowed_updates
+        return self._call_api('setWebhook', url=url, **params)
+
+    def answer_inline_query(
+        self, inline_query_id: str, results: List[InlineQueryResult], *,
+        cache_time: Optional[int] = None, is_personal: Optional[bool] = None,
+    ) -> Awaitable[Any]:
+        params: Dict[str, Any] = {}
+        if cache_time is not None:
+            params['cache_time'] = cache_time
+        if is_personal is not None:
+            params['is_personal'] = is_personal
+        return self._call_api(
+            'answerInlineQuery', inline_query_id=inline_query_id,
+            results=results, **params,
+        )
 
     async def get_username(self, force: bool = False) -> str:
         if self._username is not None and not force:
             return self._username
-        response = await self._call_api('getMe')
-        username = cast(str, response['result']['username'])
+        me = await self._call_api('getMe')
+        username = cast(str, me['username'])
         self.log.debug('Bot username: %s', username)
         self._username = username
         return username
@@ -0,0 +1,150 @@
+import threading
+from bisect import bisect_left, insort
+from collections import OrderedDict
+from itertools import islice
+from typing import AbstractSet, Iterable, Iterator, List, Optional, Set, Tuple
+
+from .types import User, UserID
+
+
+def normalize_query(query: str) -> str:
+    return query.strip().lstrip('@').lower()
+
+
+def full_name(user: User) -> str:
+    if user['last_name']:
+        return f'{user["first_name"]} {user["last_name"]}'
+    return user['first_name']
+
+
+def _index_keys(user: User) -> Set[str]:
+    keys = set(full_name(user).lower().split())
+    if user['username']:
+        keys.add(user['username'].lower())
+    return keys
+
+
+def _matches(user: User, query: str) -> bool:
+    username = user['username']
+    return bool(
+        username and username.lower().startswith(query)
+        or query in full_name(user).lower()
+    )
+
+
+class UserDirectory:
+    """Users collected from updates, searchable by id, username and name.
+
+    Lookups go through a sorted index of lowercased usernames and name
+    words, so a search examines at most max_scanned index entries of
+    visible users however large the directory is. When there are at most
+    max_scanned visible users, they are matched directly instead. The
+    least recently seen users are evicted once there are more than maxsize
+    of them.
+    """
+
+    max_scanned = 1000
+
+    def __init__(self, maxsize: int = 100_000) -> None:
+        self._maxsize = maxsize
+        # least recently seen first
+        self._users: OrderedDict[UserID, User] = OrderedDict()
+        # sorted (key, user id) pairs, see _index_keys
+        self._index: List[Tuple[str, UserID]] = []
+        # processors may run in the executor, see UpdateDispatcher
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._users)
+
+    def update(self, users: Iterable[User]) -> None:
+        with self._lock:
+            for user in users:
+                user_id = user['id']
+                old_user = self._users.get(user_id)
+                if old_user == user:
+                    # seen again, unchanged: only refresh its LRU position
+                    self._users.move_to_end(user_id)
+                    continue
+                if old_user is not None:
+                    del self._users[user_id]
+                    self._unindex(old_user)
+                self._users[user_id] = user
+                for key in _index_keys(user):
+                    insort(self._index, (key, user_id))
+            while len(self._users) > self._maxsize:
+                _, evicted_user = self._users.popitem(last=False)
+                self._unindex(evicted_user)
+
+    def _unindex(self, user: User) -> None:
+        for key in _index_keys(user):
+            entry = (key, user['id'])
+            index = bisect_left(self._index, entry)
+            if index < len(self._index) and self._index[index] == entry:
+                del self._index[index]
+
+    def search(
+        self, query: str, limit: int,
+        visible: Optional[AbstractSet[UserID]] = None,
+    ) -> List[User]:
+        """Find users matching the normalized query.
+
+        An exact id match comes first, followed by users whose username
+        starts with the query or whose full name contains a word starting
+        with the query. If visible is given, other users are skipped.
+        """
+        if not query:
+            return []
+        with self._lock:
+            found: OrderedDict[UserID, User] = OrderedDict()
+            if query.isdecimal():
+                user = self._users.get(UserID(int(query)))
+                if user is not None and (
+                    visible is None or user['id'] in visible
+                ):
+                    found[user['id']] = user
+            # multi-word queries are looked up by the longest (usually most
+            # selective) word and then matched against the full name
+            prefix = max(query.split(), key=len)
+            matches: Iterable[User]
+            if visible is not None and len(visible) <= self.max_scanned:
+                matches = self._search_visible(query, prefix, visible)
+            else:
+                matches = self._search_index(query, prefix, visible)
+            for user in matches:
+                if len(found) >= limit:
+                    break
+                found.setdefault(user['id'], user)
+            return list(found.values())
+
+    def _search_visible(
+        self, query: str, prefix: str, visible: AbstractSet[UserID],
+    ) -> List[User]:
+        # few enough users to match each of them, ordered as in the index
+        matches = []
+        for user_id in visible:
+            user = self._users.get(user_id)
+            if user is None or not _matches(user, query):
+                continue
+            keys = [key for key in _index_keys(user) if key.startswith(prefix)]
+            if keys:
+                matches.append((min(keys), user_id, user))
+        matches.sort(key=lambda match: match[:2])
+        return [user for _, _, user in matches]
+
+    def _search_index(
+        self, query: str, prefix: str,
+        visible: Optional[AbstractSet[UserID]],
+    ) -> Iterator[User]:
+        # only entries of visible users count towards max_scanned
+        scanned = 0
+        start = bisect_left(self._index, (prefix,))
+        for key, user_id in islice(self._index, start, None):
+            if scanned >= self.max_scanned or not key.startswith(prefix):
+                break
+            if visible is not None and user_id not in visible:
+                continue
+            scanned += 1
+            user = self._users[user_id]
+            if _matches(user, query):
+                yield user
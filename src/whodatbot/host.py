@@ -0,0 +1,170 @@
+import asyncio
+import configparser
+from typing import List, NamedTuple, Optional
+
+import aiohttp
+
+from .bot import ShutdownReport, WebhookServer, WhoDatBot
+from .profiling import DispatchProfiler
+from .utils import LoggerDescriptor, LoopLagMonitor, cancel_other_tasks
+
+
+class BotConfig(NamedTuple):
+
+    name: str
+    token: str
+    webhook_url_template: str
+    webhook_secret: str
+
+
+class HostConfig(NamedTuple):
+
+    webhook_port: int
+    bots: List[BotConfig]
+
+
+def load_config(path: str) -> HostConfig:
+    """Load a multi-bot config from an INI file.
+
+    The listener port and any shared bot options live in the [DEFAULT]
+    section, every other section describes one bot:
+
+        [DEFAULT]
+        webhook_port = 8080
+        webhook_url_template = https://example.com/webhook/{secret}
+
+        [somebot]
+        token = 123:abc
+        webhook_secret = s0m3s3cr3t
+    """
+    parser = configparser.ConfigParser(interpolation=None)
+    with open(path) as fobj:
+        parser.read_file(fobj)
+    try:
+        webhook_port = parser.getint(configparser.DEFAULTSECT, 'webhook_port')
+    except configparser.NoOptionError:
+        raise ValueError('missing option: webhook_port') from None
+    bots = []
+    for name in parser.sections():
+        section = parser[name]
+        try:
+            bots.append(BotConfig(
+                name=name,
+                token=section['token'],
+                webhook_url_template=section['webhook_url_template'],
+                webhook_secret=section['webhook_secret'],
+            ))
+        except KeyError as exc:
+            raise ValueError(f'missing option: {name}.{exc.args[0]}') from None
+    if not bots:
+        raise ValueError('no bots configured')
+    return HostConfig(webhook_port=webhook_port, bots=bots)
+
+
+class WhoDatBotHost:
+
+    bot_class = WhoDatBot
+
+    log = LoggerDescriptor()
+
+    _stop_task: Optional['asyncio.Future[ShutdownReport]'] = None
+    _lag_monitor_task: Optional['asyncio.Task[None]'] = None
+
+    def __init__(
+        self, config: HostConfig, *,
+        profiler: Optional[DispatchProfiler] = None,
+        shutdown_timeout: float = 10.0,
+        loop: Optional[asyncio.AbstractEventLoop] = None,
+    ) -> None:
+        if loop is None:
+            loop = asyncio.get_event_loop()
+        self._loop = loop
+        if profiler is None:
+            profiler = DispatchProfiler(loop=loop)
+        self.profiler = profiler
+        self._session = aiohttp.ClientSession(loop=loop)
+        self._server = WebhookServer(port=config.webhook_port, loop=loop)
+        # bot config section name -> bot
+        self._bots = {
+            bot_config.name: self.bot_class(
+                token=bot_config.token,
+                webhook_url_template=bot_config.webhook_url_template,
+                webhook_secret=bot_config.webhook_secret,
+                webhook_port=config.webhook_port,
+                session=self._session,
+                server=self._server,
+                profiler=profiler,
+                shutdown_timeout=shutdown_timeout,
+                loop=loop,
+            )
+            for bot_config in config.bots
+        }
+
+    async def start(self) -> None:
+        """Start all bots, dropping the ones that fail to start.
+
+        A bad entry (e.g., a revoked token) doesn't stop the rest of the
+        bots. Raises RuntimeError if no bot started.
+        """
+        self.log.info('starting %d bot(s)', len(self._bots))
+        names = list(self._bots)
+        results = await asyncio.gather(
+            *(self._bots[name].start() for name in names),
+            return_exceptions=True,
+        )
+        for name, result in zip(names, results):
+            if isinstance(result, BaseException):
+                self.log.error('[%s] failed to start', name, exc_info=result)
+                bot = self._bots.pop(name)
+                self._server.remove_route(bot.secret_path)
+                await bot.stop()
+        if not self._bots:
+            raise RuntimeError('no bot started')
+        # the bots share the event loop, so it is monitored once for all
+        lag_monitor = LoopLagMonitor(
+            interval=self.bot_class.dispatcher_class.lag_check_interval,
+            on_lag=self.on_lag,
+        )
+        self._lag_monitor_task = asyncio.create_task(lag_monitor.run())
+        self.log.info('started %d bot(s)', len(self._bots))
+
+    async def run(self) -> None:
+        await self.start()
+        await self._server.run()
+
+    async def stop(self) -> ShutdownReport:
+        if self._stop_task is None:
+            self._stop_task = asyncio.ensure_future(self._stop())
+        return await asyncio.shield(self._stop_task)
+
+    async def _stop(self) -> ShutdownReport:
+        self._server.drain()
+        if self._lag_monitor_task is not None:
+            self._lag_monitor_task.cancel()
+        # every bot drains against its own (equal) deadline concurrently
+        results = await asyncio.gather(
+            *(bot.stop() for bot in self._bots.values()),
+            return_exceptions=True,
+        )
+        pending_updates = pending_calls = 0
+        for result in results:
+            if isinstance(result, BaseException):
+                self.log.error('bot shutdown failed', exc_info=result)
+            else:
+                pending_updates += result.pending_updates
+                pending_calls += result.pending_calls
+        await self._session.close()
+        self.log.info(
+            'shutdown complete, left behind %d update(s) and %d API call(s)',
+            pending_updates, pending_calls,
+        )
+        self._server.stop()
+        return ShutdownReport(pending_updates, pending_calls)
+
+    async def close(self) -> None:
+        await self.stop()
+        await cancel_other_tasks()
+
+    def on_lag(self, lag: float) -> None:
+        for bot in self._bots.values():
+            bot.on_lag(lag)
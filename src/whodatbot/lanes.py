@@ -0,0 +1,119 @@
+import asyncio
+import time
+from collections import deque
+from typing import Deque, Dict, Generic, NamedTuple, Optional, Tuple, TypeVar
+
+
+T = TypeVar('T')
+
+
+class LaneStats(NamedTuple):
+
+    size: int
+    # seconds the oldest queued item has been waiting
+    oldest_age: float
+    processed: int
+    average_wait: float
+    max_wait: float
+
+
+class _Lane(Generic[T]):
+
+    def __init__(self, weight: int) -> None:
+        self.weight = weight
+        self.current_weight = 0
+        # (enqueue time, item)
+        self.items: Deque[Tuple[float, T]] = deque()
+        self.processed = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+
+class LaneQueue(Generic[T]):
+    """Queue with a FIFO lane per priority class.
+
+    Non-empty lanes are served with smooth weighted round-robin, so a lane
+    with weight 8 gets 8 items for every item of a lane with weight 1, but
+    no lane is starved. get() returns None once the queue is closed and
+    all lanes are empty.
+    """
+
+    def __init__(self, weights: Dict[str, int], default_lane: str) -> None:
+        if default_lane not in weights:
+            raise ValueError(f'unknown default lane: {default_lane}')
+        for name, weight in weights.items():
+            if weight < 1:
+                raise ValueError(f'invalid lane weight: {name}={weight}')
+        self._lanes: Dict[str, _Lane[T]] = {
+            name: _Lane(weight) for name, weight in weights.items()}
+        self._default_lane = default_lane
+        self._size = 0
+        self._closed = False
+        self._not_empty = asyncio.Event()
+
+    def qsize(self) -> int:
+        return self._size
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def put_nowait(self, item: T, lane: Optional[str] = None) -> None:
+        if self._closed:
+            raise RuntimeError('queue is closed')
+        if lane not in self._lanes:
+            lane = self._default_lane
+        self._lanes[lane].items.append((time.monotonic(), item))
+        self._size += 1
+        self._not_empty.set()
+
+    def close(self) -> None:
+        self._closed = True
+        self._not_empty.set()
+
+    async def get(self) -> Optional[T]:
+        while not self._size:
+            if self._closed:
+                return None
+            self._not_empty.clear()
+            await self._not_empty.wait()
+        lane = self._select()
+        enqueued, item = lane.items.popleft()
+        self._size -= 1
+        wait = time.monotonic() - enqueued
+        lane.processed += 1
+        lane.total_wait += wait
+        lane.max_wait = max(lane.max_wait, wait)
+        return item
+
+    def _select(self) -> _Lane[T]:
+        total_weight = 0
+        selected: Optional[_Lane[T]] = None
+        for lane in self._lanes.values():
+            if not lane.items:
+                continue
+            lane.current_weight += lane.weight
+            total_weight += lane.weight
+            if (
+                selected is None
+                or lane.current_weight > selected.current_weight
+            ):
+                selected = lane
+        assert selected is not None, 'all lanes are empty'
+        selected.current_weight -= total_weight
+        return selected
+
+    def stats(self) -> Dict[str, LaneStats]:
+        now = time.monotonic()
+        return {
+            name: LaneStats(
+                size=len(lane.items),
+                oldest_age=now - lane.items[0][0] if lane.items else 0.0,
+                processed=lane.processed,
+                average_wait=(
+                    lane.total_wait / lane.processed if lane.processed else 0.0
+                ),
+                max_wait=lane.max_wait,
+            )
+            for name, lane in self._lanes.items()
+        }
@@ -0,0 +1,190 @@
+import threading
+from array import array
+from bisect import bisect_left
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Set
+
+from .types import ChatID, ChatMemberUpdated, Message, UserID
+
+
+GROUP_CHAT_TYPES = ('group', 'supergroup')
+# chat member statuses meaning the user is not in the chat,
+# 'restricted' members are checked with the is_member flag
+ABSENT_STATUSES = ('left', 'kicked')
+
+
+# array is not subscriptable at runtime before Python 3.9
+if TYPE_CHECKING:
+    IDArray = array[int]
+else:
+    IDArray = array
+
+
+def _new_id_array() -> IDArray:
+    return array('q')
+
+
+def _insert(ids: IDArray, value: int) -> bool:
+    index = bisect_left(ids, value)
+    if index < len(ids) and ids[index] == value:
+        return False
+    ids.insert(index, value)
+    return True
+
+
+def _remove(ids: IDArray, value: int) -> bool:
+    index = bisect_left(ids, value)
+    if index < len(ids) and ids[index] == value:
+        del ids[index]
+        return True
+    return False
+
+
+def _contains(ids: IDArray, value: int) -> bool:
+    index = bisect_left(ids, value)
+    return index < len(ids) and ids[index] == value
+
+
+def _intersect(left: IDArray, right: IDArray) -> List[int]:
+    result = []
+    i = j = 0
+    while i < len(left) and j < len(right):
+        if left[i] < right[j]:
+            i += 1
+        elif left[i] > right[j]:
+            j += 1
+        else:
+            result.append(left[i])
+            i += 1
+            j += 1
+    return result
+
+
+def _get_user_id(dct: Optional[Dict[str, Any]]) -> Optional[UserID]:
+    if not dct or dct.get('is_bot', False):
+        return None
+    return UserID(dct['id'])
+
+
+class ChatMembership:
+    """Incremental chat -> members index.
+
+    Both directions (chat -> users and user -> chats) are kept as sorted
+    arrays of 64-bit ints, that is 8 bytes per membership instead of
+    a dict entry, and are queried with binary search.
+    """
+
+    def __init__(self) -> None:
+        self._members: Dict[ChatID, IDArray] = {}
+        self._chats: Dict[UserID, IDArray] = {}
+        # processors may run in the executor, see UpdateDispatcher
+        self._lock = threading.Lock()
+
+    def add(self, chat_id: ChatID, user_id: UserID) -> None:
+        with self._lock:
+            members = self._members.get(chat_id)
+            if members is None:
+                members = self._members[chat_id] = _new_id_array()
+            if not _insert(members, user_id):
+                return
+            chats = self._chats.get(user_id)
+            if chats is None:
+                chats = self._chats[user_id] = _new_id_array()
+            _insert(chats, chat_id)
+
+    def remove(self, chat_id: ChatID, user_id: UserID) -> None:
+        with self._lock:
+            members = self._members.get(chat_id)
+            if members is None or not _remove(members, user_id):
+                return
+            if not members:
+                del self._members[chat_id]
+            chats = self._chats[user_id]
+            _remove(chats, chat_id)
+            if not chats:
+                del self._chats[user_id]
+
+    def migrate(self, chat_id: ChatID, new_chat_id: ChatID) -> None:
+        for user_id in self.members(chat_id):
+            self.remove(chat_id, user_id)
+            self.add(new_chat_id, user_id)
+
+    def is_member(self, chat_id: ChatID, user_id: UserID) -> bool:
+        with self._lock:
+            members = self._members.get(chat_id)
+            return members is not None and _contains(members, user_id)
+
+    def members(self, chat_id: ChatID) -> List[UserID]:
+        with self._lock:
+            members = self._members.get(chat_id)
+            return [UserID(m) for m in members] if members else []
+
+    def chats(self, user_id: UserID) -> List[ChatID]:
+        with self._lock:
+            chats = self._chats.get(user_id)
+            return [ChatID(c) for c in chats] if chats else []
+
+    def common_chats(
+        self, user_id: UserID, other_user_id: UserID,
+    ) -> List[ChatID]:
+        with self._lock:
+            chats = self._chats.get(user_id)
+            other_chats = self._chats.get(other_user_id)
+            if not chats or not other_chats:
+                return []
+            return [ChatID(c) for c in _intersect(chats, other_chats)]
+
+    def contacts(self, user_id: UserID) -> Set[UserID]:
+        """Return users sharing at least one chat with the user."""
+        with self._lock:
+            contacts: Set[UserID] = set()
+            for chat_id in self._chats.get(user_id, ()):
+                members = self._members[ChatID(chat_id)]
+                contacts.update(UserID(member) for member in members)
+            contacts.discard(user_id)
+            return contacts
+
+    def share_chat(self, user_id: UserID, other_user_id: UserID) -> bool:
+        with self._lock:
+            chats = self._chats.get(user_id)
+            other_chats = self._chats.get(other_user_id)
+            if not chats or not other_chats:
+                return False
+            if len(chats) > len(other_chats):
+                chats, other_chats = other_chats, chats
+            return any(_contains(other_chats, chat) for chat in chats)
+
+    def track_message(self, message: Message) -> None:
+        chat = message['chat']
+        if chat['type'] not in GROUP_CHAT_TYPES:
+            return
+        chat_id = ChatID(chat['id'])
+        if 'migrate_to_chat_id' in message:
+            self.migrate(chat_id, ChatID(message['migrate_to_chat_id']))
+            return
+        user_id = _get_user_id(message.get('from'))
+        if user_id is not None:
+            self.add(chat_id, user_id)
+        for new_member in message.get('new_chat_members', ()):
+            user_id = _get_user_id(new_member)
+            if user_id is not None:
+                self.add(chat_id, user_id)
+        user_id = _get_user_id(message.get('left_chat_member'))
+        if user_id is not None:
+            self.remove(chat_id, user_id)
+
+    def track_chat_member(self, chat_member: ChatMemberUpdated) -> None:
+        chat = chat_member['chat']
+        if chat['type'] not in GROUP_CHAT_TYPES:
+            return
+        chat_id = ChatID(chat['id'])
+        new_chat_member = chat_member['new_chat_member']
+        user_id = _get_user_id(new_chat_member['user'])
+        if user_id is None:
+            return
+        status = new_chat_member['status']
+        if status in ABSENT_STATUSES or (
+            status == 'restricted' and not new_chat_member['is_member']
+        ):
+            self.remove(chat_id, user_id)
+        else:
+            self.add(chat_id, user_id)
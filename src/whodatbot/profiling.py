@@ -0,0 +1,129 @@
+import asyncio
+import cProfile
+import pstats
+import random
+import signal
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, TypeVar
+
+from .utils import LoggerDescriptor
+
+
+T = TypeVar('T')
+
+
+TOGGLE_SIGNAL = signal.SIGUSR1
+DUMP_SIGNAL = signal.SIGUSR2
+
+
+class DispatchProfiler:
+    """Profiler of the update hot path, switched on and off at runtime.
+
+    While enabled, named stages are timed for every update, a sample_rate
+    fraction of processor calls is run under cProfile, and asyncio reports
+    callbacks blocking the loop longer than slow_callback_duration.
+    """
+
+    log = LoggerDescriptor()
+
+    def __init__(
+        self, *,
+        sample_rate: float = 0.01,
+        output_path: str = 'whodatbot.prof.txt',
+        slow_callback_duration: float = 0.1,
+        loop: Optional[asyncio.AbstractEventLoop] = None,
+    ) -> None:
+        if not 0 <= sample_rate <= 1:
+            raise ValueError(f'invalid sample rate: {sample_rate}')
+        self.sample_rate = sample_rate
+        self.output_path = output_path
+        self.slow_callback_duration = slow_callback_duration
+        if loop is None:
+            loop = asyncio.get_event_loop()
+        self._loop = loop
+        self.enabled = False
+        # stages and processors may run in the executor
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self) -> None:
+        self._stats: Optional[pstats.Stats] = None
+        # stage name -> [count, total time, max time]
+        self._timings: Dict[str, List[float]] = {}
+
+    def enable(self) -> None:
+        if self.enabled:
+            return
+        self.log.info('enabling profiler')
+        self._saved_debug = self._loop.get_debug()
+        self._saved_slow_callback_duration = self._loop.slow_callback_duration
+        self._loop.slow_callback_duration = self.slow_callback_duration
+        self._loop.set_debug(True)
+        self.enabled = True
+
+    def disable(self) -> None:
+        if not self.enabled:
+            return
+        self.log.info('disabling profiler')
+        self.enabled = False
+        self._loop.set_debug(self._saved_debug)
+        self._loop.slow_callback_duration = self._saved_slow_callback_duration
+        self.dump()
+
+    def toggle(self) -> None:
+        if self.enabled:
+            self.disable()
+        else:
+            self.enable()
+
+    def install_signal_handlers(self) -> None:
+        self._loop.add_signal_handler(TOGGLE_SIGNAL, self.toggle)
+        self._loop.add_signal_handler(DUMP_SIGNAL, self.dump)
+
+    @contextmanager
+    def timer(self, stage: str) -> Iterator[None]:
+        if not self.enabled:
+            yield
+            return
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                timing = self._timings.setdefault(stage, [0, 0.0, 0.0])
+                timing[0] += 1
+                timing[1] += elapsed
+                timing[2] = max(timing[2], elapsed)
+
+    def call(self, func: Callable[[], T]) -> T:
+        if not self.enabled or random.random() >= self.sample_rate:
+            return func()
+        profile = cProfile.Profile()
+        try:
+            return profile.runcall(func)
+        finally:
+            with self._lock:
+                if self._stats is None:
+                    self._stats = pstats.Stats(profile)
+                else:
+                    self._stats.add(profile)
+
+    def dump(self) -> None:
+        with self._lock:
+            stats, timings = self._stats, self._timings
+            self._reset()
+        with open(self.output_path, 'w') as fobj:
+            fobj.write('stage count total_ms avg_ms max_ms\n')
+            for stage, (count, total, max_) in sorted(timings.items()):
+                fobj.write(
+                    f'{stage} {count:.0f} {total * 1000:.3f} '
+                    f'{total / count * 1000:.3f} {max_ * 1000:.3f}\n'
+                )
+            if stats is not None:
+                fobj.write('\n')
+                stats.stream = fobj   # type: ignore
+                stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(50)
+        self.log.info('profiler stats dumped to %s', self.output_path)
@@ -15,3 +15,11 @@ class User(TypedDict):
     first_name: str
     last_name: Optional[str]
     username: Optional[str]
+
+
+ChatID = NewType('ChatID', int)
+
+ChatMemberUpdated = Dict[str, Any]
+
+InlineQuery = Dict[str, Any]
+InlineQueryResult = Dict[str, Any]
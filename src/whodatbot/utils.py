@@ -1,11 +1,19 @@
+import asyncio
 import logging
 import string
-from typing import Any, Dict, List, Optional, Tuple, Type, TypeVar
+import threading
+import time
+from collections import OrderedDict
+from typing import (
+    Any, Callable, Dict, Generic, List, Optional, Tuple, Type, TypeVar,
+)
 
 from .types import Message, User, UserID
 
 
 T = TypeVar('T')
+K = TypeVar('K')
+V = TypeVar('V')
 
 
 class LoggerDescriptor:
@@ -63,6 +71,73 @@ class TemplateFormatter(string.Formatter):
         return f'{{{key}}}'
 
 
+class TTLCache(Generic[K, V]):
+    """LRU cache with entries expiring ttl seconds after they are set."""
+
+    def __init__(
+        self, *, maxsize: int, ttl: float,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self._maxsize = maxsize
+        self._ttl = ttl
+        self._clock = clock
+        # key -> (expiration time, value), least recently used first
+        self._entries: OrderedDict[K, Tuple[float, V]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: K) -> Optional[V]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires <= self._clock():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: K, value: V) -> None:
+        with self._lock:
+            self._entries[key] = (self._clock() + self._ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._maxsize:
+                self._entries.popitem(last=False)
+
+
+class LoopLagMonitor:
+
+    log = LoggerDescriptor()
+
+    def __init__(
+        self, *, interval: float, on_lag: Callable[[float], None],
+    ) -> None:
+        self._interval = interval
+        self._on_lag = on_lag
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self._interval)
+            lag = max(loop.time() - started - self._interval, 0.0)
+            try:
+                self._on_lag(lag)
+            except Exception:
+                self.log.exception('')
+
+
+async def cancel_other_tasks() -> None:
+    current_task = asyncio.current_task()
+    tasks = [t for t in asyncio.all_tasks() if t is not current_task]
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
 def _extract_users(dct: Dict[str, Any], accum: Dict[UserID, User]) -> None:
     if 'id' in dct and 'first_name' in dct:
         user_id = dct['id']
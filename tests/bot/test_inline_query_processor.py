@@ -0,0 +1,86 @@
+import asyncio
+
+import pytest
+
+from whodatbot.bot import UpdateDispatcher
+from whodatbot.profiling import DispatchProfiler
+
+
+GROUP = {'type': 'supergroup', 'title': 'group name', 'id': -456}
+JOHN = {'is_bot': False, 'first_name': 'John', 'id': 123}
+PETER = {
+    'is_bot': False, 'first_name': 'Peter', 'username': 'pak01', 'id': 45,
+}
+ROGER = {'is_bot': False, 'first_name': 'Roger', 'id': 67}
+
+
+class StubClient:
+
+    def __init__(self):
+        self.answers = []
+
+    async def answer_inline_query(self, inline_query_id, results, **params):
+        self.answers.append((inline_query_id, results, params))
+
+
+@pytest.fixture
+def answers():
+    client = StubClient()
+    updates = [
+        {
+            'update_id': 1, 'message': {
+                'message_id': 1, 'from': JOHN, 'chat': GROUP,
+                'new_chat_members': [PETER],
+            },
+        },
+        {
+            'update_id': 2, 'message': {
+                'message_id': 2, 'from': ROGER,
+                'chat': {'type': 'private', 'first_name': 'Roger', 'id': 67},
+            },
+        },
+    ]
+    for update_id, (asker, query) in enumerate([
+        (JOHN, 'pak'), (JOHN, '@PAK '), (ROGER, 'pak'), (JOHN, 'roger'),
+    ], 3):
+        updates.append({
+            'update_id': update_id, 'inline_query': {
+                'id': str(update_id), 'from': asker, 'query': query,
+                'offset': '',
+            },
+        })
+
+    async def _process():
+        dispatcher = UpdateDispatcher(
+            client=client, profiler=DispatchProfiler())
+        for update in updates:
+            result = dispatcher._process(update)
+            if result is not None:
+                await result
+        return dispatcher
+
+    dispatcher = asyncio.run(_process())
+    return dispatcher, client.answers
+
+
+def test_visible_users_only(answers):
+    _, answers = answers
+    results = {query_id: results for query_id, results, _ in answers}
+    assert [result['id'] for result in results['3']] == ['45']
+    assert results['3'][0]['description'] == '@pak01, id 45'
+    # Roger shares no group with Peter, John shares no group with Roger
+    assert results['5'] == []
+    assert results['6'] == []
+
+
+def test_personal_answers(answers):
+    _, answers = answers
+    for _, _, params in answers:
+        assert params == {'cache_time': 300, 'is_personal': True}
+
+
+def test_cache(answers):
+    dispatcher, answers = answers
+    # the second query of John hits the same cache entry
+    assert answers[0][1] is answers[1][1]
+    assert len(dispatcher.inline_cache) == 3
@@ -0,0 +1,34 @@
+import asyncio
+import logging
+
+from whodatbot.bot import WhoDatBot
+
+
+class Bot(WhoDatBot):
+
+    lane_stats_interval = 0.05
+
+
+def test_on_lag_logs_lane_stats(caplog):
+    caplog.set_level(logging.INFO)
+
+    async def _test():
+        bot = Bot(
+            token='T', webhook_url_template='https://example.com/{secret}',
+            webhook_secret='secret', webhook_port=8080, session=object(),
+        )
+        dispatcher = bot._dispatcher
+        threshold = dispatcher.offload_threshold
+        bot.on_lag(dispatcher.lag_target * 2)
+        assert dispatcher.offload_threshold == threshold // 2
+        assert 'lane:' not in caplog.text
+        await asyncio.sleep(0.1)
+        bot.on_lag(0.0)
+        lines = [
+            record.getMessage() for record in caplog.records
+            if 'lane:' in record.getMessage()
+        ]
+        assert [line.split(' lane:')[0] for line in lines] == [
+            '@None interactive', '@None default']
+
+    asyncio.run(_test())
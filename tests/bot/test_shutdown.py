@@ -0,0 +1,207 @@
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+
+from whodatbot.bot import (
+    ShutdownReport, UpdateDispatcher, UpdateProcessor, WebhookServer,
+    WhoDatBot,
+)
+from whodatbot.client import BotAPIClient
+from whodatbot.host import BotConfig, HostConfig, WhoDatBotHost
+from whodatbot.profiling import DispatchProfiler
+
+
+PROCESSED = []
+
+
+class SlowProcessor(UpdateProcessor, update_type='_test_slow'):
+
+    def __call__(self):
+        time.sleep(self.update_body['sleep'])
+        PROCESSED.append(self.update_id)
+
+
+class StubResponse:
+
+    def __init__(self, body, delay):
+        self._body = body
+        self._delay = delay
+
+    async def __aenter__(self):
+        await asyncio.sleep(self._delay)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        pass
+
+    async def read(self):
+        return self._body
+
+
+class StubSession:
+
+    def __init__(self, delay=0):
+        self.delay = delay
+
+    def post(self, url, data, headers):
+        return StubResponse(b'{"ok": true, "result": true}', self.delay)
+
+
+class StubRequest:
+
+    def __init__(self, path, body, on_read=None):
+        self.method = 'POST'
+        self.path = path
+        self._body = body
+        self._on_read = on_read
+
+    async def read(self):
+        if self._on_read is not None:
+            self._on_read()
+        return self._body
+
+
+def make_update(update_id, sleep=0):
+    return {'update_id': update_id, '_test_slow': {'sleep': sleep}}
+
+
+async def run_dispatcher(updates, timeout):
+    with ThreadPoolExecutor() as executor:
+        dispatcher = UpdateDispatcher(
+            client=None, profiler=DispatchProfiler(), executor=executor)
+        dispatcher.offload_threshold = 0
+        for update in updates:
+            dispatcher.put_nowait(update, 1)
+        run_task = asyncio.ensure_future(dispatcher.run())
+        await asyncio.sleep(0)
+        left = await dispatcher.drain(timeout)
+        run_task.cancel()
+        await asyncio.gather(run_task, return_exceptions=True)
+        return left
+
+
+def test_drain_processes_queued_updates():
+    PROCESSED.clear()
+    updates = [make_update(update_id) for update_id in range(5)]
+    assert asyncio.run(run_dispatcher(updates, timeout=5)) == 0
+    assert PROCESSED == [0, 1, 2, 3, 4]
+
+
+def test_drain_timeout_reports_left_updates():
+    PROCESSED.clear()
+    updates = [make_update(update_id, sleep=0.2) for update_id in range(5)]
+    # the first update is processed, the second one is in progress
+    assert asyncio.run(run_dispatcher(updates, timeout=0.3)) == 3
+
+
+def test_put_after_drain_is_rejected():
+
+    async def _test():
+        dispatcher = UpdateDispatcher(
+            client=None, profiler=DispatchProfiler())
+        assert await dispatcher.drain(0) == 0
+        assert not dispatcher.put_nowait(make_update(1))
+
+    asyncio.run(_test())
+
+
+def test_flush_waits_for_in_flight_calls():
+
+    async def _test():
+        client = BotAPIClient(token='T', session=StubSession(delay=0.05))
+        call = asyncio.ensure_future(client.set_webhook('url'))
+        await asyncio.sleep(0)
+        assert await client.flush(timeout=0.01) == 1
+        assert await client.flush(timeout=1) == 0
+        assert call.done()
+        assert await client.flush(timeout=0) == 0
+
+    asyncio.run(_test())
+
+
+def test_stop_twice_returns_same_report():
+
+    async def _test():
+        bot = WhoDatBot(
+            token='T', webhook_url_template='https://example.com/{secret}',
+            webhook_secret='secret', webhook_port=8080, session=StubSession(),
+        )
+        report = await bot.stop()
+        assert report == ShutdownReport(pending_updates=0, pending_calls=0)
+        assert await bot.stop() is report
+
+    asyncio.run(_test())
+
+
+def test_host_stop_twice_returns_same_report():
+
+    async def _test():
+        config = HostConfig(webhook_port=8080, bots=[
+            BotConfig(
+                name=name, token=name,
+                webhook_url_template='https://example.com/{secret}',
+                webhook_secret=name,
+            )
+            for name in ['foo', 'bar']
+        ])
+        host = WhoDatBotHost(config)
+        report = await host.stop()
+        assert report == ShutdownReport(pending_updates=0, pending_calls=0)
+        assert await host.stop() is report
+
+    asyncio.run(_test())
+
+
+def test_server_answers_503_while_draining():
+    updates = []
+
+    def on_update(body):
+        updates.append(body)
+        return True
+
+    async def _test():
+        server = WebhookServer(
+            port=8080, secret_path='/secret', on_update=on_update)
+        body = json.dumps(make_update(1)).encode()
+        response = await server.handler(StubRequest('/secret', body))
+        assert response.status == HTTPStatus.NO_CONTENT
+        # drained while the body is being read
+        response = await server.handler(
+            StubRequest('/secret', body, on_read=server.drain))
+        assert response.status == HTTPStatus.SERVICE_UNAVAILABLE
+        response = await server.handler(StubRequest('/secret', body))
+        assert response.status == HTTPStatus.SERVICE_UNAVAILABLE
+        response = await server.handler(StubRequest('/unknown', body))
+        assert response.status == HTTPStatus.FORBIDDEN
+
+    asyncio.run(_test())
+    assert len(updates) == 1
+
+
+def test_server_answers_503_when_update_rejected():
+
+    async def _test():
+        server = WebhookServer(
+            port=8080, secret_path='/secret',
+            on_update=lambda body: False,
+        )
+        response = await server.handler(StubRequest('/secret', b'{}'))
+        assert response.status == HTTPStatus.SERVICE_UNAVAILABLE
+
+    asyncio.run(_test())
+
+
+def test_server_answers_403_to_invalid_body():
+
+    def on_update(body):
+        raise ValueError('invalid')
+
+    async def _test():
+        server = WebhookServer(
+            port=8080, secret_path='/secret', on_update=on_update)
+        response = await server.handler(StubRequest('/secret', b'{'))
+        assert response.status == HTTPStatus.FORBIDDEN
+
+    asyncio.run(_test())
@@ -0,0 +1,117 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from whodatbot.bot import UpdateDispatcher, UpdateProcessor
+from whodatbot.profiling import DispatchProfiler
+
+
+THREADS = []
+
+
+class ThreadRecordingProcessor(
+    UpdateProcessor, update_type='_test_thread_recording',
+):
+
+    def __call__(self):
+        THREADS.append((self.update_id, threading.current_thread().name))
+
+
+def make_dispatcher(**kwargs):
+    return UpdateDispatcher(
+        client=None, profiler=DispatchProfiler(), **kwargs)
+
+
+@pytest.fixture
+def dispatcher():
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    yield make_dispatcher()
+    asyncio.set_event_loop(None)
+    loop.close()
+
+
+def test_tune_down_and_up(dispatcher):
+    dispatcher.tune(dispatcher.lag_target * 2)
+    assert dispatcher.offload_threshold == 32 * 1024
+    dispatcher.tune(dispatcher.lag_target)
+    assert dispatcher.offload_threshold == 32 * 1024
+    dispatcher.tune(0)
+    assert dispatcher.offload_threshold == 40 * 1024
+
+
+def test_tune_bounds(dispatcher):
+    for _ in range(100):
+        dispatcher.tune(1)
+    assert dispatcher.offload_threshold == dispatcher.min_offload_threshold
+    for _ in range(100):
+        dispatcher.tune(0)
+    # back to the baseline, never above it
+    assert dispatcher.offload_threshold == UpdateDispatcher.offload_threshold
+
+
+def test_tune_idle_stays_at_baseline(dispatcher):
+    for _ in range(100):
+        dispatcher.tune(0)
+    assert dispatcher.offload_threshold == UpdateDispatcher.offload_threshold
+
+
+def test_offload():
+    THREADS.clear()
+
+    async def _test():
+        with ThreadPoolExecutor(thread_name_prefix='offload') as executor:
+            dispatcher = make_dispatcher(executor=executor)
+            dispatcher.offload_threshold = 100
+            dispatcher.put_nowait(
+                {'update_id': 1, '_test_thread_recording': {}}, 100)
+            dispatcher.put_nowait(
+                {'update_id': 2, '_test_thread_recording': {}}, 101)
+            run_task = asyncio.ensure_future(dispatcher.run())
+            await asyncio.sleep(0)
+            assert await dispatcher.drain(timeout=5) == 0
+            await run_task
+
+    asyncio.run(_test())
+    main_thread = threading.main_thread().name
+    assert THREADS[0] == (1, main_thread)
+    assert THREADS[1][0] == 2
+    assert THREADS[1][1].startswith('offload')
+
+
+@pytest.mark.parametrize('body', [b'', b'{', b'[]', b'"update"'])
+def test_put_body_invalid(dispatcher, body):
+    with pytest.raises(ValueError):
+        dispatcher.put_body(body)
+    assert dispatcher.queue.qsize() == 0
+
+
+def test_put_body_decodes_small_bodies_only():
+    THREADS.clear()
+
+    async def _test():
+        with ThreadPoolExecutor(thread_name_prefix='offload') as executor:
+            dispatcher = make_dispatcher(executor=executor)
+            dispatcher.offload_threshold = 60
+            small = b'{"update_id": 1, "_test_thread_recording": {}}'
+            large = small.replace(b'1', b'2').ljust(61)
+            assert dispatcher.put_body(small)
+            assert dispatcher.put_body(large)
+            queued = [await dispatcher.queue.get() for _ in range(2)]
+            assert queued == [
+                ({'update_id': 1, '_test_thread_recording': {}}, len(small)),
+                (large, 61),
+            ]
+            for item in queued:
+                dispatcher.queue.put_nowait(item)
+            run_task = asyncio.ensure_future(dispatcher.run())
+            await asyncio.sleep(0)
+            assert await dispatcher.drain(timeout=5) == 0
+            await run_task
+
+    asyncio.run(_test())
+    assert THREADS[0] == (1, threading.main_thread().name)
+    assert THREADS[1][0] == 2
+    assert THREADS[1][1].startswith('offload')
@@ -0,0 +1,118 @@
+import asyncio
+import json
+
+import pytest
+
+from whodatbot.client import BotAPIClient, BotAPIClientError
+
+
+class StubResponse:
+
+    def __init__(self, body):
+        self._body = body
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        pass
+
+    async def read(self):
+        return self._body
+
+
+class StubSession:
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.requests = []
+
+    def post(self, url, data, headers):
+        self.requests.append((url, data, dict(headers)))
+        return StubResponse(json.dumps(self.responses.pop(0)).encode())
+
+
+@pytest.fixture(autouse=True)
+def loop():
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    yield loop
+    asyncio.set_event_loop(None)
+    loop.close()
+
+
+def call(client, method, **params):
+    loop = asyncio.get_event_loop()
+    return loop.run_until_complete(client._call_api(method, **params))
+
+
+def make_client(session, **kwargs):
+    return BotAPIClient(
+        token='123:abc', session=session,
+        url_template='https://example.com/bot{token}/{method}', **kwargs,
+    )
+
+
+def test_returns_result():
+    session = StubSession({'ok': True, 'result': {'username': 'who_bot'}})
+    client = make_client(session)
+    assert call(client, 'getMe') == {'username': 'who_bot'}
+    url, data, headers = session.requests[0]
+    assert url == 'https://example.com/bot123:abc/getMe'
+    assert json.loads(data) == {}
+    assert headers == {'Content-Type': 'application/json'}
+
+
+def test_error():
+    session = StubSession({
+        'ok': False, 'error_code': 401, 'description': 'Unauthorized'})
+    client = make_client(session)
+    with pytest.raises(BotAPIClientError) as excinfo:
+        call(client, 'getMe')
+    assert excinfo.value.error_code == 401
+    assert excinfo.value.description == 'Unauthorized'
+
+
+def test_url_cache(monkeypatch):
+    session = StubSession(*[{'ok': True, 'result': True}] * 3)
+    client = make_client(session)
+    formatted = []
+    template = client._url_template
+
+    class Template(str):
+
+        def format(self, **kwargs):
+            formatted.append(kwargs['method'])
+            return template.format(**kwargs)
+
+    monkeypatch.setattr(client, '_url_template', Template(template))
+    call(client, 'getMe')
+    call(client, 'getMe')
+    call(client, 'setWebhook', url='url')
+    assert formatted == ['getMe', 'setWebhook']
+    assert [url for url, _, _ in session.requests] == [
+        'https://example.com/bot123:abc/getMe',
+        'https://example.com/bot123:abc/getMe',
+        'https://example.com/bot123:abc/setWebhook',
+    ]
+
+
+def test_pluggable_json():
+    encoded, decoded = [], []
+
+    def json_dumps(obj):
+        encoded.append(obj)
+        # like orjson.dumps
+        return json.dumps(obj).encode()
+
+    def json_loads(body):
+        decoded.append(body)
+        return json.loads(body)
+
+    session = StubSession({'ok': True, 'result': True})
+    client = make_client(
+        session, json_dumps=json_dumps, json_loads=json_loads)
+    assert call(client, 'setWebhook', url='url') is True
+    assert encoded == [{'url': 'url'}]
+    assert session.requests[0][1] == b'{"url": "url"}'
+    assert decoded == [b'{"ok": true, "result": true}']
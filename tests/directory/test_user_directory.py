@@ -0,0 +1,147 @@
+import pytest
+
+from whodatbot.directory import UserDirectory, normalize_query
+
+
+JOHN = {
+    'id': 123, 'first_name': 'John', 'last_name': 'Smith', 'username': None,
+}
+PETER = {
+    'id': 45, 'first_name': 'Peter', 'last_name': None, 'username': 'pak01',
+}
+ROGER = {
+    'id': 67, 'first_name': 'Roger', 'last_name': 'Smith',
+    'username': 'PakRoger',
+}
+
+
+@pytest.fixture
+def directory():
+    directory = UserDirectory()
+    directory.update([JOHN, PETER, ROGER])
+    return directory
+
+
+@pytest.mark.parametrize('query,expected', [
+    ('pak01', 'pak01'),
+    ('  @Pak01 ', 'pak01'),
+    ('John Smith', 'john smith'),
+])
+def test_normalize_query(query, expected):
+    assert normalize_query(query) == expected
+
+
+@pytest.mark.parametrize('query,expected', [
+    ('', []),
+    ('nobody', []),
+    ('123', [JOHN]),
+    ('\u00b2', []),
+    ('pak01', [PETER]),
+    ('pakroger', [ROGER]),
+    ('pak', [PETER, ROGER]),
+    ('smith', [ROGER, JOHN]),
+    ('smi', [ROGER, JOHN]),
+    ('mith', []),
+    ('john smith', [JOHN]),
+])
+def test_search(directory, query, expected):
+    assert directory.search(query, limit=10) == expected
+
+
+def test_search_id_match_first(directory):
+    directory.update([{
+        'id': 1, 'first_name': '123', 'last_name': None, 'username': None,
+    }])
+    assert [user['id'] for user in directory.search('123', 2)] == [123, 1]
+
+
+def test_search_limit(directory):
+    assert directory.search('smith', limit=1) == [ROGER]
+
+
+def test_search_max_scanned(directory):
+    directory.update([
+        {
+            'id': user_id, 'first_name': 'Smith', 'last_name': None,
+            'username': None,
+        }
+        for user_id in range(1, 11)
+    ])
+    directory.max_scanned = 5
+    # 1..5 are scanned, 67 and 123 are past the bound
+    assert [user['id'] for user in directory.search('smith', 20)] == [
+        1, 2, 3, 4, 5]
+
+
+def test_maxsize():
+    directory = UserDirectory(maxsize=2)
+    directory.update([JOHN, PETER])
+    directory.update([JOHN, ROGER])
+    assert len(directory) == 2
+    assert directory.search('peter', limit=10) == []
+    assert directory.search('pak', limit=10) == [ROGER]
+    assert directory.search('john', limit=10) == [JOHN]
+
+
+def test_update_username(directory):
+    directory.update([dict(PETER, username='peter')])
+    assert len(directory) == 3
+    assert directory.search('pak01', limit=10) == []
+    assert directory.search('peter', limit=10) == [
+        dict(PETER, username='peter')]
+
+
+def test_update_unchanged(directory):
+    index = list(directory._index)
+    directory.update([dict(JOHN)])
+    assert directory._index == index
+    assert list(directory._users) == [45, 67, 123]
+    # John was refreshed, so Peter is the least recently seen now
+    directory._maxsize = 2
+    directory.update([])
+    assert list(directory._users) == [67, 123]
+    assert directory._index == [
+        entry for entry in index if entry[1] != 45]
+
+
+@pytest.mark.parametrize('max_scanned', [1, 1000])
+def test_search_visible(directory, max_scanned):
+    # both the direct and the index lookup
+    directory.max_scanned = max_scanned
+    visible = {45, 123}
+    assert directory.search('pak', 10, visible) == [PETER]
+    assert directory.search('67', 10, visible) == []
+    assert directory.search('123', 10, visible) == [JOHN]
+    assert directory.search('smith', 10, visible) == [JOHN]
+
+
+def make_alexes(count):
+    return [
+        {
+            'id': user_id, 'first_name': 'Alex', 'last_name': f'N{user_id}',
+            'username': None,
+        }
+        for user_id in range(count)
+    ]
+
+
+@pytest.mark.parametrize('query', ['alex', 'alex n4999', 'n4999'])
+def test_search_visible_past_scan_window(query):
+    directory = UserDirectory()
+    directory.update(make_alexes(5000))
+    assert [
+        user['id'] for user in directory.search(query, 20, {4999})
+    ] == [4999]
+
+
+def test_search_many_visible_past_scan_window():
+    directory = UserDirectory()
+    directory.max_scanned = 10
+    directory.update(make_alexes(5000))
+    visible = set(range(4000, 5000))
+    assert [
+        user['id'] for user in directory.search('alex', 5, visible)
+    ] == [4000, 4001, 4002, 4003, 4004]
+    assert [
+        user['id'] for user in directory.search('alex n4999', 5, visible)
+    ] == [4999]
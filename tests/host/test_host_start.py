@@ -0,0 +1,81 @@
+import asyncio
+
+import pytest
+
+from whodatbot.bot import WhoDatBot
+from whodatbot.client import BotAPIClientError
+from whodatbot.host import BotConfig, HostConfig, WhoDatBotHost
+
+
+STARTED = []
+
+
+class Bot(WhoDatBot):
+
+    async def start(self):
+        if self._webhook_url.endswith('/bad'):
+            raise BotAPIClientError(401, 'Unauthorized')
+        STARTED.append(self._webhook_url)
+
+
+class Host(WhoDatBotHost):
+
+    bot_class = Bot
+
+
+def make_config(*names):
+    return HostConfig(webhook_port=8080, bots=[
+        BotConfig(
+            name=name, token=name,
+            webhook_url_template='https://example.com/{secret}',
+            webhook_secret=name,
+        )
+        for name in names
+    ])
+
+
+def test_failed_bot_is_dropped():
+    STARTED.clear()
+
+    async def _test():
+        host = Host(make_config('foo', 'bad', 'bar'))
+        await host.start()
+        assert sorted(host._bots) == ['bar', 'foo']
+        assert sorted(host._server._routes) == ['/bar', '/foo']
+        await host.stop()
+
+    asyncio.run(_test())
+    assert sorted(STARTED) == [
+        'https://example.com/bar', 'https://example.com/foo']
+
+
+def test_no_bot_started():
+
+    async def _test():
+        host = Host(make_config('bad'))
+        try:
+            with pytest.raises(RuntimeError) as excinfo:
+                await host.start()
+            assert str(excinfo.value) == 'no bot started'
+        finally:
+            await host.stop()
+
+    asyncio.run(_test())
+
+
+def test_lag_tunes_all_bots():
+
+    async def _test():
+        host = Host(make_config('foo', 'bar'))
+        await host.start()
+        lag_monitor_task = host._lag_monitor_task
+        assert not lag_monitor_task.done()
+        dispatchers = [bot._dispatcher for bot in host._bots.values()]
+        threshold = dispatchers[0].offload_threshold
+        host.on_lag(dispatchers[0].lag_target * 2)
+        assert [d.offload_threshold for d in dispatchers] == [
+            threshold // 2, threshold // 2]
+        await host.stop()
+        assert lag_monitor_task.cancelled()
+
+    asyncio.run(_test())
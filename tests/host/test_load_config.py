@@ -0,0 +1,66 @@
+import pytest
+
+from whodatbot.host import BotConfig, load_config
+
+
+@pytest.fixture
+def config_path(tmp_path, request):
+    path = tmp_path / 'whodatbot.ini'
+    path.write_text(request.param)
+    return str(path)
+
+
+@pytest.mark.parametrize('config_path', ['''
+[DEFAULT]
+webhook_port = 8080
+webhook_url_template = https://example.com/{secret}
+
+[foobot]
+token = 123:foo
+webhook_secret = foosecret
+
+[barbot]
+token = 456:bar
+webhook_url_template = https://example.com:{port}/bar/{secret}
+webhook_secret = barsecret
+'''], indirect=True)
+def test_valid_config(config_path):
+    config = load_config(config_path)
+    assert config.webhook_port == 8080
+    assert config.bots == [
+        BotConfig(
+            name='foobot',
+            token='123:foo',
+            webhook_url_template='https://example.com/{secret}',
+            webhook_secret='foosecret',
+        ),
+        BotConfig(
+            name='barbot',
+            token='456:bar',
+            webhook_url_template='https://example.com:{port}/bar/{secret}',
+            webhook_secret='barsecret',
+        ),
+    ]
+
+
+@pytest.mark.parametrize('config_path,error', [
+    (
+        '[foobot]\ntoken = 1\n',
+        'missing option: webhook_port',
+    ),
+    (
+        '[DEFAULT]\nwebhook_port = 8080\n',
+        'no bots configured',
+    ),
+    (
+        (
+            '[DEFAULT]\nwebhook_port = 8080\n'
+            '[foobot]\ntoken = 1\nwebhook_url_template = {secret}\n'
+        ),
+        'missing option: foobot.webhook_secret',
+    ),
+], indirect=['config_path'])
+def test_invalid_config(config_path, error):
+    with pytest.raises(ValueError) as excinfo:
+        load_config(config_path)
+    assert str(excinfo.value) == error
@@ -0,0 +1,87 @@
+import asyncio
+
+import pytest
+
+from whodatbot.lanes import LaneQueue
+
+
+def drain(queue):
+
+    async def _drain():
+        queue.close()
+        items = []
+        while True:
+            item = await queue.get()
+            if item is None:
+                return items
+            items.append(item)
+
+    return asyncio.run(_drain())
+
+
+@pytest.mark.parametrize('weights,default_lane,error', [
+    ({'a': 1}, 'b', 'unknown default lane: b'),
+    ({'a': 1, 'b': 0}, 'a', 'invalid lane weight: b=0'),
+])
+def test_invalid_lanes(weights, default_lane, error):
+    with pytest.raises(ValueError) as excinfo:
+        LaneQueue(weights, default_lane)
+    assert str(excinfo.value) == error
+
+
+def test_fifo_within_lane():
+    queue = LaneQueue({'a': 1}, 'a')
+    for item in range(5):
+        queue.put_nowait(item)
+    assert queue.qsize() == 5
+    assert drain(queue) == [0, 1, 2, 3, 4]
+    assert queue.qsize() == 0
+
+
+def test_unknown_lane_goes_to_default():
+    queue = LaneQueue({'fast': 3, 'slow': 1}, 'slow')
+    queue.put_nowait('x', 'unknown')
+    queue.put_nowait('y')
+    stats = queue.stats()
+    assert stats['slow'].size == 2
+    assert stats['fast'].size == 0
+
+
+def test_weighted_fair():
+    queue = LaneQueue({'fast': 3, 'slow': 1}, 'slow')
+    for item in range(8):
+        queue.put_nowait(f's{item}', 'slow')
+    for item in range(6):
+        queue.put_nowait(f'f{item}', 'fast')
+    assert drain(queue) == [
+        'f0', 'f1', 's0', 'f2', 'f3', 'f4', 's1', 'f5',
+        's2', 's3', 's4', 's5', 's6', 's7',
+    ]
+    stats = queue.stats()
+    assert stats['fast'].processed == 6
+    assert stats['slow'].processed == 8
+    assert stats['slow'].max_wait >= stats['slow'].average_wait >= 0
+
+
+def test_put_after_close():
+    queue = LaneQueue({'a': 1}, 'a')
+    queue.close()
+    with pytest.raises(RuntimeError):
+        queue.put_nowait(1)
+
+
+def test_get_waits_for_put():
+
+    async def _test():
+        queue = LaneQueue({'a': 1}, 'a')
+        getter = asyncio.ensure_future(queue.get())
+        await asyncio.sleep(0)
+        assert not getter.done()
+        queue.put_nowait(42)
+        assert await getter == 42
+        getter = asyncio.ensure_future(queue.get())
+        await asyncio.sleep(0)
+        queue.close()
+        assert await getter is None
+
+    asyncio.run(_test())
@@ -0,0 +1,120 @@
+import pytest
+
+from whodatbot.membership import ChatMembership
+
+
+GROUP = {'type': 'supergroup', 'title': 'group name', 'id': -456}
+OTHER_GROUP = {'type': 'group', 'title': 'other group', 'id': -789}
+JOHN = {'is_bot': False, 'first_name': 'John', 'id': 123}
+PETER = {'is_bot': False, 'first_name': 'Peter', 'id': 45}
+ROGER = {'is_bot': False, 'first_name': 'Roger', 'id': 67}
+BOT = {'is_bot': True, 'first_name': 'tiny[stash]', 'id': 419864769}
+
+
+@pytest.fixture
+def membership():
+    return ChatMembership()
+
+
+def test_add_remove(membership):
+    membership.add(-1, 3)
+    membership.add(-1, 1)
+    membership.add(-1, 2)
+    membership.add(-1, 2)
+    membership.add(-2, 2)
+    assert membership.members(-1) == [1, 2, 3]
+    assert membership.chats(2) == [-2, -1]
+    assert membership.is_member(-1, 1)
+    membership.remove(-1, 1)
+    membership.remove(-1, 1)
+    assert not membership.is_member(-1, 1)
+    assert membership.members(-1) == [2, 3]
+    assert membership.chats(1) == []
+    membership.remove(-2, 2)
+    assert membership.members(-2) == []
+
+
+def test_common_chats(membership):
+    for chat_id in [-5, -4, -3, -1]:
+        membership.add(chat_id, 1)
+    for chat_id in [-4, -2, -1]:
+        membership.add(chat_id, 2)
+    assert membership.common_chats(1, 2) == [-4, -1]
+    assert membership.common_chats(1, 3) == []
+
+
+def test_track_message(membership):
+    membership.track_message({
+        'message_id': 1, 'from': JOHN, 'chat': GROUP, 'text': 'hi',
+    })
+    membership.track_message({
+        'message_id': 2, 'from': JOHN, 'chat': GROUP,
+        'new_chat_members': [PETER, ROGER, BOT],
+    })
+    membership.track_message({
+        'message_id': 3, 'from': JOHN, 'chat': GROUP,
+        'left_chat_member': ROGER,
+    })
+    membership.track_message({
+        'message_id': 4, 'from': PETER,
+        'chat': {'type': 'private', 'first_name': 'Peter', 'id': 45},
+        'text': 'hi',
+    })
+    assert membership.members(-456) == [45, 123]
+    assert membership.chats(45) == [-456]
+    assert membership.chats(BOT['id']) == []
+
+
+def test_track_message_migrate(membership):
+    membership.track_message({'message_id': 1, 'from': JOHN, 'chat': GROUP})
+    membership.track_message({
+        'message_id': 2, 'from': JOHN, 'chat': GROUP,
+        'migrate_to_chat_id': -100456,
+    })
+    assert membership.members(-456) == []
+    assert membership.members(-100456) == [123]
+
+
+@pytest.mark.parametrize('status,is_member,expected', [
+    ('member', None, [45]),
+    ('administrator', None, [45]),
+    ('restricted', True, [45]),
+    ('restricted', False, []),
+    ('left', None, []),
+    ('kicked', None, []),
+])
+def test_track_chat_member(membership, status, is_member, expected):
+    membership.add(-789, 45)
+    new_chat_member = {'user': PETER, 'status': status}
+    if is_member is not None:
+        new_chat_member['is_member'] = is_member
+    membership.track_chat_member({
+        'chat': OTHER_GROUP, 'from': JOHN, 'date': 1573660000,
+        'old_chat_member': {'user': PETER, 'status': 'member'},
+        'new_chat_member': new_chat_member,
+    })
+    assert membership.members(-789) == expected
+
+
+def test_share_chat(membership):
+    for chat_id in [-5, -3]:
+        membership.add(chat_id, 1)
+    for chat_id in [-4, -3, -1]:
+        membership.add(chat_id, 2)
+    membership.add(-4, 3)
+    assert membership.share_chat(1, 2)
+    assert membership.share_chat(2, 3)
+    assert not membership.share_chat(1, 3)
+    assert not membership.share_chat(1, 4)
+
+
+def test_contacts(membership):
+    membership.add(-1, 1)
+    membership.add(-1, 2)
+    membership.add(-2, 1)
+    membership.add(-2, 3)
+    membership.add(-3, 4)
+    assert membership.contacts(1) == {2, 3}
+    assert membership.contacts(2) == {1}
+    assert membership.contacts(4) == set()
+    assert membership.contacts(5) == set()
@@ -0,0 +1,51 @@
+import asyncio
+
+import pytest
+
+from whodatbot.profiling import DispatchProfiler
+
+
+@pytest.fixture
+def loop():
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.close()
+
+
+@pytest.fixture
+def profiler(loop, tmp_path):
+    return DispatchProfiler(
+        sample_rate=1, output_path=str(tmp_path / 'prof.txt'), loop=loop)
+
+
+@pytest.mark.parametrize('sample_rate', [-0.1, 1.1])
+def test_invalid_sample_rate(loop, sample_rate):
+    with pytest.raises(ValueError):
+        DispatchProfiler(sample_rate=sample_rate, loop=loop)
+
+
+def test_disabled(profiler, loop):
+    with profiler.timer('stage'):
+        pass
+    assert profiler.call(lambda: 42) == 42
+    profiler.dump()
+    with open(profiler.output_path) as fobj:
+        assert fobj.read() == 'stage count total_ms avg_ms max_ms\n'
+    assert not loop.get_debug()
+
+
+def test_toggle(profiler, loop):
+    profiler.toggle()
+    assert profiler.enabled
+    assert loop.get_debug()
+    assert loop.slow_callback_duration == profiler.slow_callback_duration
+    for _ in range(3):
+        with profiler.timer('stage'):
+            assert profiler.call(lambda: 42) == 42
+    profiler.toggle()
+    assert not profiler.enabled
+    assert not loop.get_debug()
+    with open(profiler.output_path) as fobj:
+        lines = fobj.read().splitlines()
+    assert lines[1].startswith('stage 3 ')
+    assert 'function calls' in lines[3]
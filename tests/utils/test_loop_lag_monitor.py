@@ -0,0 +1,42 @@
+import asyncio
+
+from whodatbot.utils import LoopLagMonitor
+
+
+def test_reports_lag():
+    lags = []
+
+    async def _test():
+        monitor = LoopLagMonitor(interval=0.01, on_lag=lags.append)
+        task = asyncio.ensure_future(monitor.run())
+        await asyncio.sleep(0.015)
+        # block the loop past the next check
+        loop = asyncio.get_running_loop()
+        blocked_until = loop.time() + 0.05
+        while loop.time() < blocked_until:
+            pass
+        await asyncio.sleep(0.03)
+        task.cancel()
+
+    asyncio.run(_test())
+    assert len(lags) >= 2
+    assert all(lag >= 0 for lag in lags)
+    assert max(lags) >= 0.03
+
+
+def test_failing_callback_does_not_stop_monitor():
+    calls = []
+
+    def on_lag(lag):
+        calls.append(lag)
+        raise RuntimeError('boom')
+
+    async def _test():
+        monitor = LoopLagMonitor(interval=0.01, on_lag=on_lag)
+        task = asyncio.ensure_future(monitor.run())
+        await asyncio.sleep(0.06)
+        assert not task.done()
+        task.cancel()
+
+    asyncio.run(_test())
+    assert len(calls) >= 2
@@ -0,0 +1,51 @@
+import pytest
+
+from whodatbot.utils import TTLCache
+
+
+class Clock:
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+@pytest.fixture
+def cache(clock):
+    return TTLCache(maxsize=2, ttl=10, clock=clock)
+
+
+def test_get_set(cache):
+    assert cache.get('foo') is None
+    cache.set('foo', 1)
+    assert cache.get('foo') == 1
+    cache.set('foo', 2)
+    assert cache.get('foo') == 2
+    assert len(cache) == 1
+
+
+def test_expiration(cache, clock):
+    cache.set('foo', 1)
+    clock.now = 9.9
+    assert cache.get('foo') == 1
+    clock.now = 10
+    assert cache.get('foo') is None
+    assert len(cache) == 0
+
+
+def test_lru_eviction(cache):
+    cache.set('foo', 1)
+    cache.set('bar', 2)
+    assert cache.get('foo') == 1
+    cache.set('baz', 3)
+    assert cache.get('bar') is None
+    assert cache.get('foo') == 1
+    assert cache.get('baz') == 3
+    assert len(cache) == 2